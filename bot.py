@@ -1,56 +1,155 @@
 import os
 import re
-import json
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from telegram.constants import ParseMode
-import gspread
-from google.oauth2.service_account import Credentials
 from collections import defaultdict
+import asyncio
+import threading
+import time
 import google.generativeai as genai
+from gemini_utils import JSONArrayStream, episode_key, extract_json_object, match_anime_names, normalize_url, validate_episode
+from sheets_db import GoogleSheetsDB
 
 
 # Configuration
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 SPREADSHEET_NAME = "Anime Database"
 SERVICE_ACCOUNT_FILE = "Credentials.json"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "your channel id"))
 AUTHORIZED_UPLOADERS = [ "your id" , " friend id"]
+GEMINI_MODEL = "gemini-2.0-flash"
+# USD per 1M tokens
+GEMINI_INPUT_PRICE = float(os.getenv("GEMINI_INPUT_PRICE", "0.10"))
+GEMINI_OUTPUT_PRICE = float(os.getenv("GEMINI_OUTPUT_PRICE", "0.40"))
 genai.configure(api_key=GEMINI_API_KEY)
+class TokenUsage:
+    """Token accounting for Gemini calls, per handler and per user"""
+    def __init__(self):
+        self.by_handler = defaultdict(self._empty)
+        self.by_user = defaultdict(self._empty)
+        # Calls are recorded from the event loop and from upload worker threads
+        self.lock = threading.Lock()
+   
+    @staticmethod
+    def _empty():
+        return {'calls': 0, 'prompt': 0, 'response': 0, 'seconds': 0.0}
+   
+    def record(self, handler, user_id, response, elapsed):
+        """Record usage_metadata of a Gemini response"""
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        response_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+       
+        with self.lock:
+            buckets = [self.by_handler[handler]]
+            if user_id is not None:
+                buckets.append(self.by_user[user_id])
+            for stats in buckets:
+                stats['calls'] += 1
+                stats['prompt'] += prompt_tokens
+                stats['response'] += response_tokens
+                stats['seconds'] += elapsed
+       
+        print(f"Gemini [{handler}] user={user_id} prompt={prompt_tokens} response={response_tokens} "
+              f"time={elapsed:.2f}s cost=${self.cost(prompt_tokens, response_tokens):.6f}")
+   
+    @staticmethod
+    def cost(prompt_tokens, response_tokens):
+        """Estimated USD cost for token counts"""
+        return (prompt_tokens * GEMINI_INPUT_PRICE + response_tokens * GEMINI_OUTPUT_PRICE) / 1_000_000
+   
+    def _format_line(self, label, stats):
+        avg = stats['seconds'] / stats['calls'] if stats['calls'] else 0
+        return (f"• {label}: {stats['calls']} calls, {stats['prompt']} in / {stats['response']} out, "
+                f"avg {avg:.2f}s, ${self.cost(stats['prompt'], stats['response']):.4f}\n")
+   
+    def report(self, user_id=None):
+        """Format usage summary"""
+        with self.lock:
+            return self._report(user_id)
+   
+    def _report(self, user_id):
+        if user_id is not None:
+            if user_id not in self.by_user:
+                return "No Gemini usage recorded."
+            return self._format_line(f"<code>{user_id}</code>", self.by_user[user_id])
+       
+        if not self.by_handler:
+            return "No Gemini usage recorded."
+       
+        text = "<b>By handler:</b>\n"
+        for handler, stats in sorted(self.by_handler.items()):
+            text += self._format_line(handler, stats)
+       
+        text += "\n<b>By user:</b>\n"
+        top_users = sorted(self.by_user.items(), key=lambda x: -(x[1]['prompt'] + x[1]['response']))
+        for uid, stats in top_users[:10]:
+            text += self._format_line(f"<code>{uid}</code>", stats)
+        return text
 class GeminiAssistant:
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = genai.GenerativeModel(GEMINI_MODEL)
         self.chat_sessions = {}
+        self.chat_context = {}
+        self.usage = TokenUsage()
+   
+    def _generate(self, prompt, handler, user_id=None):
+        """Call Gemini and record token usage"""
+        start = time.monotonic()
+        response = self.model.generate_content(prompt)
+        self.usage.record(handler, user_id, response, time.monotonic() - start)
+        return response
+   
+    def _generate_stream(self, prompt, handler, user_id=None):
+        """Stream Gemini response text and record token usage"""
+        start = time.monotonic()
+        response = self.model.generate_content(prompt, stream=True)
+        try:
+            for chunk in response:
+                yield chunk.text
+        finally:
+            self.usage.record(handler, user_id, response, time.monotonic() - start)
        
-    def parse_bulk_upload(self, text):
-        """Parse bulk upload with Gemini AI and regex fallback"""
+    def iter_bulk_upload(self, text, user_id=None):
+        """Yield episodes as Gemini streams them; entries Gemini missed come from the regex parser"""
         prompt = f"""Parse this bulk upload and extract anime information.
 Return JSON array with fields: anime_name, season, episode, quality, audio, url
 Message:
 {text}
 Example: [{{"anime_name": "365 Days to the Wedding", "season": "S01", "episode": "E01", "quality": "480p", "audio": "Single", "url": "https://..."}}]
 Return ONLY valid JSON array."""
+        stream = JSONArrayStream()
+        seen_urls = set()
+        gemini_keys = set()
+        rejected = 0
         try:
-            response = self.model.generate_content(prompt)
-            result = response.text.strip()
-           
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.startswith('```'):
-                result = result[3:]
-            if result.endswith('```'):
-                result = result[:-3]
-           
-            episodes = json.loads(result.strip())
-            if isinstance(episodes, list) and len(episodes) > 0:
-                return episodes
+            for chunk in self._generate_stream(prompt, "upload", user_id):
+                for item in stream.feed(chunk):
+                    ep = validate_episode(item)
+                    if not ep:
+                        rejected += 1
+                    elif ep['url'] not in seen_urls:
+                        seen_urls.add(ep['url'])
+                        gemini_keys.add(episode_key(ep))
+                        yield ep
         except Exception as e:
             print(f"Gemini parsing failed: {e}")
+        rejected += stream.rejected
+       
+        if seen_urls and stream.complete and not rejected:
+            return
+        if seen_urls:
+            state = "complete" if stream.complete else "truncated"
+            print(f"Gemini output {state} with {len(seen_urls)} episodes and {rejected} rejected, recovering the rest with regex")
        
-        return self._regex_parse(text)
+        # Fill the gaps only: skip entries Gemini returned, even if it formatted the URL differently
+        for ep in self._regex_parse(text):
+            if ep['url'] not in seen_urls and episode_key(ep) not in gemini_keys:
+                seen_urls.add(ep['url'])
+                yield ep
    
     def _regex_parse(self, text):
         """Enhanced regex parser supporting multiple formats"""
@@ -89,9 +188,9 @@ Return ONLY valid JSON array."""
             url_match = re.search(r'(https?://[^\s]+)', entry)
             if not url_match:
                 return None
-            url = url_match.group(1).strip('`)')
+            url = normalize_url(url_match.group(1))
            
-            entry_clean = entry.replace(url, '').strip()
+            entry_clean = entry.replace(url_match.group(1), '').strip()
            
             # Extract Season/Episode - support multiple formats
             # [S01-E01], [S01E01], [S1-E1], S01E01, 1x01, etc.
@@ -167,47 +266,50 @@ Return ONLY valid JSON array."""
         except Exception as e:
             print(f"Parse error for entry: {e}")
             return None
-    def interpret_query(self, query_text, available_anime):
+    def interpret_query(self, query_text, available_anime, user_id=None):
         """Interpret natural language queries"""
+        candidates = match_anime_names(query_text, available_anime)
         prompt = f"""Interpret anime query and return search parameters.
-Available: {', '.join(available_anime[:20])}
+Available: {', '.join(candidates) if candidates else 'none matched'}
 Query: "{query_text}"
 Return JSON:
 {{"anime_name": "name or null", "season": "S1 or null", "episode": "E01 or null", "quality": "720p or null", "audio": "Dual or null", "intent": "search"}}
 Return ONLY valid JSON."""
         try:
-            response = self.model.generate_content(prompt)
-            result = response.text.strip()
-           
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.startswith('```'):
-                result = result[3:]
-            if result.endswith('```'):
-                result = result[:-3]
-           
-            return json.loads(result.strip())
+            response = self._generate(prompt, "search", user_id)
+            return extract_json_object(response.text)
         except Exception as e:
             print(f"Query error: {e}")
             return {"intent": "search", "anime_name": query_text}
-    def chat(self, user_id, message, database_context=None):
+    def chat(self, user_id, message, database_context=None, relevant_titles=None):
         """Chat with Gemini AI"""
         if user_id not in self.chat_sessions:
             self.chat_sessions[user_id] = self.model.start_chat(history=[])
        
         chat = self.chat_sessions[user_id]
+        context_lines = []
+        # The session history already holds the summary sent earlier; only resend it when the catalog changes
+        if database_context and self.chat_context.get(user_id) != database_context:
+            context_lines.append(f"Database: {database_context}")
+        if relevant_titles:
+            context_lines.append(f"Relevant titles: {', '.join(relevant_titles)}")
         full_message = message
-        if database_context:
-            full_message = f"Database: {database_context}\n\nUser: {message}"
+        if context_lines:
+            full_message = "\n".join(context_lines) + f"\n\nUser: {message}"
        
         try:
+            start = time.monotonic()
             response = chat.send_message(full_message)
+            self.usage.record("chat", user_id, response, time.monotonic() - start)
+            if database_context:
+                self.chat_context[user_id] = database_context
             return response.text
         except Exception as e:
             return f"Error: {str(e)}"
    
     def clear_chat(self, user_id):
         """Clear chat history"""
+        self.chat_context.pop(user_id, None)
         if user_id in self.chat_sessions:
             del self.chat_sessions[user_id]
             return True
@@ -237,132 +339,6 @@ Return ONLY valid JSON."""
                 counter += 1
        
         return "".join(output) if output else "No results."
-class GoogleSheetsDB:
-    def __init__(self, credentials_file, spreadsheet_name):
-        self.creds = Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
-        self.client = gspread.authorize(self.creds)
-        self.spreadsheet_name = spreadsheet_name
-        self.sheet = None
-        self.init_sheet()
-   
-    def init_sheet(self):
-        """Initialize Google Sheet"""
-        try:
-            self.spreadsheet = self.client.open(self.spreadsheet_name)
-            self.sheet = self.spreadsheet.sheet1
-           
-            first_row = self.sheet.row_values(1)
-            if not first_row or first_row[0] != "Anime ID":
-                headers = ["Anime ID", "Anime Name", "Season", "Episode", "Quality", "Audio", "Download URL", "Added Date", "Status"]
-                self.sheet.insert_row(headers, 1)
-                self.sheet.format('A1:I1', {
-                    'backgroundColor': {'red': 0.27, 'green': 0.45, 'blue': 0.77},
-                    'textFormat': {'bold': True, 'foregroundColor': {'red': 1, 'green': 1, 'blue': 1}},
-                    'horizontalAlignment': 'CENTER'
-                })
-        except gspread.SpreadsheetNotFound:
-            print(f"Spreadsheet '{self.spreadsheet_name}' not found!")
-            raise
-   
-    def get_next_anime_id(self):
-        """Generate next ID"""
-        all_values = self.sheet.get_all_values()[1:]
-        max_id = 0
-        for row in all_values:
-            if row and row[0]:
-                match = re.search(r'AN(\d+)', row[0])
-                if match:
-                    max_id = max(max_id, int(match.group(1)))
-        return f"AN{str(max_id + 1).zfill(3)}"
-   
-    def find_anime_id(self, anime_name):
-        """Find ID by name"""
-        all_values = self.sheet.get_all_values()[1:]
-        for row in all_values:
-            if row and len(row) > 1 and row[1].lower().strip() == anime_name.lower().strip():
-                return row[0]
-        return None
-   
-    def add_episode(self, anime_name, season, episode, quality, audio, url, status="Active"):
-        """Add episode to database - allows multiple qualities for same episode"""
-        try:
-            anime_id = self.find_anime_id(anime_name)
-            if not anime_id:
-                anime_id = self.get_next_anime_id()
-           
-            # Check for exact duplicates (same anime, season, episode, quality, and URL)
-            existing = self.query_anime(anime_name=anime_name, season=season, episode=episode, quality=quality)
-            if existing:
-                # Check if URL already exists
-                for ep in existing:
-                    if ep['url'] == url:
-                        return None, "Exact duplicate"
-                # Different URL with same quality is allowed (alternative source)
-           
-            date_added = datetime.now().strftime("%Y-%m-%d %H:%M")
-            new_row = [anime_id, anime_name, season, episode, quality, audio, url, date_added, status]
-            self.sheet.append_row(new_row)
-            return anime_id, "Success"
-        except Exception as e:
-            print(f"Add error: {e}")
-            return None, f"Error: {str(e)}"
-   
-    def query_anime(self, anime_name=None, season=None, episode=None, quality=None, audio=None):
-        """Query episodes"""
-        try:
-            all_values = self.sheet.get_all_values()[1:]
-            results = []
-           
-            for row in all_values:
-                if not row or not row[0]:
-                    continue
-               
-                match = True
-                if anime_name and anime_name.lower() not in row[1].lower():
-                    match = False
-                if season and row[2].upper() != season.upper():
-                    match = False
-                if episode and row[3].upper() != episode.upper():
-                    match = False
-                if quality and quality.lower() not in row[4].lower():
-                    match = False
-                if audio and audio.lower() not in row[5].lower():
-                    match = False
-               
-                if match and len(row) >= 7:
-                    results.append({
-                        'anime_id': row[0],
-                        'anime_name': row[1],
-                        'season': row[2],
-                        'episode': row[3],
-                        'quality': row[4],
-                        'audio': row[5],
-                        'url': row[6],
-                        'date_added': row[7] if len(row) > 7 else 'N/A',
-                        'status': row[8] if len(row) > 8 else 'Active'
-                    })
-            return results
-        except Exception as e:
-            print(f"Query error: {e}")
-            return []
-   
-    def get_all_anime_names(self):
-        """Get all anime names"""
-        try:
-            all_values = self.sheet.get_all_values()[1:]
-            anime_set = set()
-            for row in all_values:
-                if row and len(row) > 1 and row[1]:
-                    anime_set.add(row[1])
-            return sorted(list(anime_set))
-        except Exception as e:
-            print(f"Get names error: {e}")
-            return []
-   
-    def get_summary(self):
-        """Get database summary"""
-        anime_list = self.get_all_anime_names()
-        return f"Available anime ({len(anime_list)}): {', '.join(anime_list[:10])}"
 # Initialize
 gemini = GeminiAssistant()
 db = GoogleSheetsDB(SERVICE_ACCOUNT_FILE, SPREADSHEET_NAME)
@@ -402,6 +378,25 @@ async def log_upload_to_channel(context, user_id, username, episodes, added, ski
         await context.bot.send_message(chat_id=LOG_CHANNEL_ID, text=log_message, parse_mode=ParseMode.HTML)
     except Exception as e:
         print(f"Upload log failed: {e}")
+async def stream_bulk_upload(text, user_id):
+    """Drain the Gemini stream in a worker thread so it never waits on Sheets writes,
+    yielding episodes on the event loop as they arrive"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+   
+    def produce():
+        try:
+            for ep in gemini.iter_bulk_upload(text, user_id):
+                loop.call_soon_threadsafe(queue.put_nowait, ep)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+   
+    producer = asyncio.create_task(asyncio.to_thread(produce))
+    try:
+        while (ep := await queue.get()) is not None:
+            yield ep
+    finally:
+        await producer
 # Bot Handlers
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -443,8 +438,8 @@ async def chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
    
     message = ' '.join(context.args)
-    db_context = db.get_summary()
-    response = gemini.chat(user_id, message, db_context)
+    db_context, relevant = await asyncio.to_thread(db.get_chat_context, message)
+    response = gemini.chat(user_id, message, db_context, relevant)
    
     await update.message.reply_text(f"🤖 {response}", parse_mode=ParseMode.HTML)
 async def myid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -499,6 +494,59 @@ async def listauth_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text += f"{idx}. <code>{uid}</code>\n"
    
     await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+async def usage_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show Gemini token usage - totals for admins, own usage for everyone else"""
+    user_id = update.effective_user.id
+   
+    if user_id not in AUTHORIZED_UPLOADERS:
+        text = "📊 <b>Your Gemini Usage</b>\n\n" + gemini.usage.report(user_id)
+    else:
+        text = "📊 <b>Gemini Usage</b>\n\n" + gemini.usage.report()
+   
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+async def migrate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Split sheet1 into shard worksheets; /migrate clear also empties sheet1"""
+    user_id = update.effective_user.id
+    username = update.effective_user.username or update.effective_user.first_name
+   
+    if user_id not in AUTHORIZED_UPLOADERS:
+        await update.message.reply_text("⛔ Admin only.")
+        return
+   
+    clear_source = bool(context.args) and context.args[0].lower() == "clear"
+   
+    if db.directory:
+        if not clear_source:
+            await update.message.reply_text(
+                "ℹ️ Catalog is already sharded.\n"
+                "Use /migrate clear to empty the sheet1 backup."
+            )
+            return
+        try:
+            await asyncio.to_thread(db.clear_source_sheet)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Clearing sheet1 failed: {str(e)[:100]}")
+            return
+        await log_to_channel(context, user_id, username, "Shard Migration", "Cleared sheet1 backup")
+        await update.message.reply_text("✅ sheet1 backup cleared.")
+        return
+   
+    await update.message.reply_text("⏳ Splitting sheet1 into shards...")
+    try:
+        counts = await asyncio.to_thread(db.migrate_to_shards, clear_source)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Migration failed: {str(e)[:100]}")
+        return
+   
+    details = "\n".join(f"• {shard}: {count} rows" for shard, count in counts.items())
+    await log_to_channel(context, user_id, username, "Shard Migration", details)
+    await update.message.reply_text(
+        f"✅ <b>Migration Complete!</b>\n\n{details or 'No rows to move.'}\n\n"
+        + ("sheet1 was cleared." if clear_source else
+           "sheet1 was kept as a backup and still counts towards the cell limit. "
+           "Run /migrate clear to empty it."),
+        parse_mode=ParseMode.HTML
+    )
 async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /upload command for better control"""
     user_id = update.effective_user.id
@@ -543,29 +591,19 @@ async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
    
     await update.message.reply_text(f"⏳ Parsing {len(text.split(chr(10)))} lines...")
    
-    episodes = gemini.parse_bulk_upload(text)
-   
-    if not episodes:
-        await log_to_channel(context, user_id, username, "Parse Failed")
-        await update.message.reply_text(
-            "❌ <b>Parse Failed</b>\n\n"
-            "Could not extract episodes. Check format:\n"
-            "<code>1. [S01-E01] Anime [480p] [Single].mkv\n"
-            "https://link</code>\n\n"
-            "Or try copying the exact format above.",
-            parse_mode=ParseMode.HTML
-        )
-        return
-   
+    episodes = []
     added = 0
     skipped = 0
     anime_ids = set()
     errors = []
     quality_counts = defaultdict(int)
    
-    for ep in episodes:
+    # Episodes are added as soon as they are parsed
+    async for ep in stream_bulk_upload(text, user_id):
+        episodes.append(ep)
         try:
-            anime_id, status = db.add_episode(
+            anime_id, status = await asyncio.to_thread(
+                db.add_episode,
                 ep['anime_name'], ep['season'], ep['episode'],
                 ep['quality'], ep['audio'], ep['url']
             )
@@ -574,17 +612,33 @@ async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 quality_counts[ep['quality']] += 1
                 if anime_id:
                     anime_ids.add(anime_id)
+            elif status.startswith("Error"):
+                errors.append(f"{ep['anime_name']} {ep['season']}{ep['episode']}: {status[:50]}")
             else:
                 skipped += 1
         except Exception as e:
             errors.append(f"{ep['anime_name']} {ep['season']}{ep['episode']}: {str(e)[:50]}")
    
+    if not episodes:
+        await log_to_channel(context, user_id, username, "Parse Failed")
+        await update.message.reply_text(
+            "❌ <b>Parse Failed</b>\n\n"
+            "Could not extract episodes. Check format:\n"
+            "<code>1. [S01-E01] Anime [480p] [Single].mkv\n"
+            "https://link</code>\n\n"
+            "Or try copying the exact format above.",
+            parse_mode=ParseMode.HTML
+        )
+        return
+   
     await log_upload_to_channel(context, user_id, username, episodes, added, skipped)
    
     result_msg = f"✅ <b>Upload Complete!</b>\n\n"
     result_msg += f"👤 Uploader: {username}\n"
     result_msg += f"✅ Added: {added} episodes\n"
     result_msg += f"⚠️ Skipped: {skipped} (duplicates)\n"
+    if errors:
+        result_msg += f"❌ Failed: {len(errors)}\n"
     result_msg += f"📺 Series: {len(anime_ids)}\n"
    
     # Show quality breakdown
@@ -595,10 +649,12 @@ async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
    
     result_msg += f"\n🔗 Check Google Sheet!"
    
-    if errors and len(errors) <= 5:
+    if errors:
         result_msg += f"\n\n<b>Errors:</b>\n"
         for err in errors[:5]:
             result_msg += f"• {err}\n"
+        if len(errors) > 5:
+            result_msg += f"... and {len(errors) - 5} more\n"
    
     await update.message.reply_text(result_msg, parse_mode=ParseMode.HTML)
 async def smart_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -619,13 +675,14 @@ async def smart_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query_text = ' '.join(context.args)
     await log_to_channel(context, user_id, username, "Search", f"Query: {query_text}")
    
-    available_anime = db.get_all_anime_names()
+    available_anime = await asyncio.to_thread(db.get_all_anime_names)
     if not available_anime:
         await update.message.reply_text("📭 Database is empty!")
         return
    
-    params = gemini.interpret_query(query_text, available_anime)
-    results = db.query_anime(
+    params = await asyncio.to_thread(gemini.interpret_query, query_text, available_anime, user_id)
+    results = await asyncio.to_thread(
+        db.query_anime,
         anime_name=params.get('anime_name'),
         season=params.get('season'),
         episode=params.get('episode'),
@@ -667,8 +724,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         # Regular chat with Gemini
         await log_to_channel(context, user_id, username, "Chat", text[:50])
-        db_context = db.get_summary()
-        response = gemini.chat(user_id, text, db_context)
+        db_context, relevant = await asyncio.to_thread(db.get_chat_context, text)
+        response = gemini.chat(user_id, text, db_context, relevant)
         await update.message.reply_text(f"🤖 {response}", parse_mode=ParseMode.HTML)
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -688,7 +745,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif query.data == "search":
         await query.edit_message_text("🔍 Type: /search <i>anime</i>", parse_mode=ParseMode.HTML)
     elif query.data == "browse":
-        anime_list = db.get_all_anime_names()
+        anime_list = await asyncio.to_thread(db.get_all_anime_names)
         if anime_list:
             text = f"📚 <b>Database ({len(anime_list)})</b>\n\n"
             text += "\n".join([f"• {anime}" for anime in anime_list[:20]])
@@ -704,12 +761,15 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Main menu
 /search - Search anime
 /chat - Talk with AI
+/usage - Gemini token usage
 /myid
 <b>Uploaders:</b>
 Reply to bulk upload with /upload
 <b>Admin:</b>
 /authorize - Add uploader
 /listauth - List users
+/migrate - Split sheet into shards
+/migrate clear - Also empty sheet1
 """
         await query.edit_message_text(help_text, parse_mode=ParseMode.HTML)
 def main():
@@ -722,7 +782,9 @@ def main():
         app.add_handler(CommandHandler("myid", myid_command))
         app.add_handler(CommandHandler("authorize", authorize_command))
         app.add_handler(CommandHandler("listauth", listauth_command))
+        app.add_handler(CommandHandler("migrate", migrate_command))
         app.add_handler(CommandHandler("upload", upload_command))
+        app.add_handler(CommandHandler("usage", usage_command))
         app.add_handler(CallbackQueryHandler(button_callback))
         app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
        
@@ -0,0 +1,172 @@
+import json
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+
+PROMPT_CANDIDATE_LIMIT = 20
+# Query words that say nothing about which title is meant
+QUERY_STOP_WORDS = {
+    "the", "and", "for", "you", "can", "find", "show", "get", "give", "want", "need", "with", "from",
+    "have", "are", "any", "all", "some", "what", "which", "where", "please", "anime", "watch",
+    "season", "episode", "part", "first", "second", "third", "last", "latest", "new",
+    "dub", "dubbed", "sub", "subbed", "dual", "single", "audio", "quality"
+}
+MATCH_MIN_SCORE = 0.3
+@lru_cache(maxsize=8192)
+def _title_words(name):
+    """Lowercase words of a title, and the distinctive ones used for fuzzy matching"""
+    words = tuple(re.findall(r'\w+', name.lower()))
+    return words, tuple(w for w in words if len(w) >= 3 and w not in QUERY_STOP_WORDS)
+def match_anime_names(query_text, names, limit=PROMPT_CANDIDATE_LIMIT):
+    """Fuzzy prefilter - return names most similar to the query, best first"""
+    query_words = re.findall(r'\w+', query_text.lower())
+    if not query_words:
+        return []
+    # Padded with spaces so whole-title checks only match on word boundaries
+    query_padded = f" {' '.join(query_words)} "
+    # Short and common words would fuzzy-match half the catalog ("me" ~ "ame")
+    matchers = []
+    for q in dict.fromkeys(query_words):
+        if len(q) >= 3 and q not in QUERY_STOP_WORDS:
+            matcher = SequenceMatcher(None)
+            matcher.set_seq2(q)
+            matchers.append((q, matcher))
+
+    scored = []
+    whole_titles = {}
+    for name in names:
+        name_words, key_words = _title_words(name)
+        if not name_words:
+            continue
+        title = f" {' '.join(name_words)} "
+        if title in query_padded:
+            # Longer titles named in the query outrank shorter ones inside them
+            whole_titles[name] = title
+            scored.append((2.0 + len(name_words), name))
+            continue
+        if not key_words or not matchers:
+            continue
+
+        # Each distinctive name word counts if a query word is a prefix of it or close to it
+        hits = 0
+        for word in key_words:
+            for q, matcher in matchers:
+                if word.startswith(q):
+                    hits += 1
+                    break
+                matcher.set_seq1(word)
+                if matcher.real_quick_ratio() >= 0.8 and matcher.quick_ratio() >= 0.8 and matcher.ratio() >= 0.8:
+                    hits += 1
+                    break
+        score = hits / len(key_words)
+        if score >= MATCH_MIN_SCORE:
+            scored.append((score, name))
+
+    # Drop titles that only matched as part of a longer title (e.g. "Tail" in "Fairy Tail")
+    titles = set(whole_titles.values())
+    covered = {t for t in titles if any(t != other and t in other for other in titles)}
+    scored = [(score, name) for score, name in scored if whole_titles.get(name) not in covered]
+
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [name for _, name in scored[:limit]]
+def normalize_url(url):
+    """URL without surrounding markup or trailing punctuation picked up from the message"""
+    return url.strip().strip('`<>').rstrip('.,;:!?)]}\'"`')
+def episode_key(ep):
+    """Identity of an episode that does not depend on how its URL was written"""
+    return (ep['anime_name'].lower().strip(), ep['season'].upper(), ep['episode'].upper(), ep['quality'].lower())
+def validate_episode(item):
+    """Normalize an episode parsed by Gemini, or return None if it is unusable"""
+    if not isinstance(item, dict):
+        return None
+    anime_name = str(item.get('anime_name') or '').strip()
+    url = normalize_url(str(item.get('url') or ''))
+    if len(anime_name) < 2 or not re.match(r'https?://\S+$', url):
+        return None
+
+    season = re.search(r'\d+', str(item.get('season') or '1'))
+    episode = re.search(r'\d+', str(item.get('episode') or ''))
+    if not season or not episode:
+        return None
+
+    return {
+        'anime_name': anime_name,
+        'season': f'S{season.group().zfill(2)}',
+        'episode': f'E{episode.group().zfill(2)}',
+        'quality': str(item.get('quality') or '720p').strip(),
+        'audio': str(item.get('audio') or 'Single').strip(),
+        'url': url
+    }
+def extract_json_object(text):
+    """Decode the first JSON object in text, ignoring code fences and surrounding prose"""
+    start = text.find('{')
+    if start == -1:
+        raise ValueError("No JSON object in response")
+    obj, _ = json.JSONDecoder().raw_decode(text[start:])
+    return obj
+class JSONArrayStream:
+    """Incremental extractor for the objects of a JSON array arriving in chunks.
+    Each complete object is returned as soon as its closing brace arrives, so a
+    truncated or partly malformed array still yields its valid prefix."""
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.complete = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None
+        self.rejected = 0
+
+    def feed(self, text):
+        """Add a chunk of text and return the objects completed by it"""
+        self.buffer += text
+        items = []
+
+        while self.pos < len(self.buffer) and not self.complete:
+            ch = self.buffer[self.pos]
+            if not self.started:
+                # Skip code fences or prose before the array, including bracketed
+                # text like [S01-E01]; the array starts at '[' followed by '{' or ']'
+                if ch == '[':
+                    rest = self.buffer[self.pos + 1:].lstrip()
+                    if not rest:
+                        # Wait for the next chunk to decide
+                        break
+                    if rest[0] in '{]':
+                        self.started = True
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == '{':
+                if self.depth == 0:
+                    self.obj_start = self.pos
+                self.depth += 1
+            elif ch == '}' and self.depth:
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        items.append(json.loads(self.buffer[self.obj_start:self.pos + 1]))
+                    except ValueError as e:
+                        self.rejected += 1
+                        print(f"Skipping malformed item: {e}")
+                    self.obj_start = None
+            elif ch == ']' and self.depth == 0:
+                self.complete = True
+            self.pos += 1
+
+        # Drop consumed text, keeping any object still in progress
+        keep = self.obj_start if self.obj_start is not None else self.pos
+        self.buffer = self.buffer[keep:]
+        self.pos -= keep
+        if self.obj_start is not None:
+            self.obj_start = 0
+        return items
@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from collections import deque
+import requests
+
+
+SHEETS_MAX_RETRIES = 5
+SHEETS_BACKOFF_BASE = 1.0
+SHEETS_BACKOFF_CAP = 32.0
+SHEETS_BREAKER_THRESHOLD = 3
+SHEETS_BREAKER_COOLDOWN = 60
+class SheetsUnavailable(Exception):
+    """Google Sheets is degraded and no cached data can be served"""
+class SheetsClient:
+    """Sheets request layer: per-minute budget, jittered retries and a circuit breaker
+    that serves cached reads to read-only callers while Sheets keeps failing"""
+    def __init__(self, reads_per_min=60, writes_per_min=60, max_retries=SHEETS_MAX_RETRIES,
+                 backoff_base=SHEETS_BACKOFF_BASE, backoff_cap=SHEETS_BACKOFF_CAP,
+                 breaker_threshold=SHEETS_BREAKER_THRESHOLD, breaker_cooldown=SHEETS_BREAKER_COOLDOWN,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.limits = {'read': reads_per_min, 'write': writes_per_min}
+        self.history = {'read': deque(), 'write': deque()}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.sleep = sleep
+        self.clock = clock
+        self.cache = {}
+        self.failures = 0
+        self.open_until = 0
+        # Handlers call in from worker threads
+        self.lock = threading.Lock()
+
+    def _wait_for_budget(self, kind):
+        """Delay the request if it would exceed the per-minute budget"""
+        window = self.history[kind]
+        while True:
+            with self.lock:
+                now = self.clock()
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                if len(window) < self.limits[kind]:
+                    window.append(now)
+                    return
+                delay = 60 - (now - window[0])
+            print(f"Sheets {kind} budget used, waiting {delay:.1f}s")
+            self.sleep(delay)
+
+    @staticmethod
+    def _status(error):
+        """HTTP status of a failed gspread call, if any"""
+        response = getattr(error, 'response', None)
+        return getattr(response, 'status_code', None)
+
+    def _is_degraded(self, error):
+        """Quota errors, server errors and dropped connections mean Sheets is struggling"""
+        status = self._status(error)
+        if status is not None:
+            return status == 429 or status >= 500
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def _record_failure(self):
+        """Count a call that failed for good, opening the circuit past the threshold"""
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.breaker_threshold:
+                print(f"Sheets circuit open for {self.breaker_cooldown}s")
+                self.open_until = self.clock() + self.breaker_cooldown
+
+    def _fallback(self, cache_key, stale_ok, error):
+        """Serve cached data to a read-only caller, or raise SheetsUnavailable"""
+        if stale_ok and cache_key in self.cache:
+            print(f"Sheets unavailable, serving cached '{cache_key}'")
+            return self.cache[cache_key]
+        raise SheetsUnavailable("Google Sheets is temporarily unavailable") from error
+
+    def call(self, kind, func, *args, cache_key=None, stale_ok=False, **kwargs):
+        """Run a gspread call of kind 'read' or 'write'.
+        Read results with a cache_key are kept; they are only served again, when Sheets
+        fails, to callers passing stale_ok - never to reads that lead to a write."""
+        if self.clock() < self.open_until:
+            return self._fallback(cache_key, stale_ok, None)
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_budget(kind)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self._is_degraded(e):
+                    raise
+                # Writes are not idempotent: only a 429 guarantees the request was not
+                # applied, after a 5xx or dropped connection it may already have landed
+                retry = kind == 'read' or self._status(e) == 429
+                if not retry or attempt == self.max_retries:
+                    self._record_failure()
+                    return self._fallback(cache_key, stale_ok, e)
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                print(f"Sheets {kind} failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                self.sleep(delay)
+            else:
+                with self.lock:
+                    self.failures = 0
+                    if cache_key is not None:
+                        self.cache[cache_key] = result
+                return result
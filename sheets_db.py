@@ -0,0 +1,309 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+import gspread
+from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+from gemini_utils import match_anime_names
+from sheets_client import SheetsClient
+
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+EPISODE_HEADERS = ["Anime ID", "Anime Name", "Season", "Episode", "Quality", "Audio", "Download URL", "Added Date", "Status"]
+DIRECTORY_HEADERS = ["Anime ID", "Anime Name", "Shard"]
+DIRECTORY_SHEET = "Directory"
+# Episode worksheets by initial letter of the anime name; anything else goes to "Episodes #"
+SHARD_RANGES = [("A", "E"), ("F", "J"), ("K", "O"), ("P", "T"), ("U", "Z")]
+SHARD_ROWS = 1000
+# Sheets API budget per minute (default per-user quota is 60 each)
+SHEETS_READS_PER_MIN = int(os.getenv("SHEETS_READS_PER_MIN", "60"))
+SHEETS_WRITES_PER_MIN = int(os.getenv("SHEETS_WRITES_PER_MIN", "60"))
+SHEETS_POOL_SIZE = 10
+def shard_for(anime_name):
+    """Worksheet title holding an anime's episodes"""
+    # Accented Latin initials route with their base letter (É -> E)
+    initial = unicodedata.normalize('NFKD', anime_name.strip()[:1]).upper()[:1]
+    for start, end in SHARD_RANGES:
+        if start <= initial <= end:
+            return f"Episodes {start}-{end}"
+    return "Episodes #"
+class GoogleSheetsDB:
+    def __init__(self, credentials_file, spreadsheet_name, client=None, api=None):
+        if client is None:
+            creds = Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+            # One pooled session reused for every Sheets request
+            session = AuthorizedSession(creds)
+            session.mount('https://', HTTPAdapter(pool_connections=SHEETS_POOL_SIZE, pool_maxsize=SHEETS_POOL_SIZE))
+            client = gspread.Client(auth=creds, session=session)
+        self.client = client
+        self.api = api or SheetsClient(SHEETS_READS_PER_MIN, SHEETS_WRITES_PER_MIN)
+        # Handlers run DB calls in worker threads; keep ID assignment and writes serialized
+        self.write_lock = threading.Lock()
+        self.spreadsheet_name = spreadsheet_name
+        self.sheet = None
+        self.directory = None
+        self.shards = {}
+        self.init_sheet()
+
+    def init_sheet(self):
+        """Initialize Google Sheet"""
+        try:
+            self.spreadsheet = self.api.call('read', self.client.open, self.spreadsheet_name)
+            # sheet1 is a metadata request in gspread 6, so it goes through the client too
+            self.sheet = self.api.call('read', self.spreadsheet.get_worksheet, 0)
+            self._setup_headers(self.sheet, EPISODE_HEADERS)
+
+            # Catalog is sharded once the directory exists (see migrate_to_shards)
+            try:
+                self.directory = self.api.call('read', self.spreadsheet.worksheet, DIRECTORY_SHEET)
+            except gspread.WorksheetNotFound:
+                self.directory = None
+        except gspread.SpreadsheetNotFound:
+            print(f"Spreadsheet '{self.spreadsheet_name}' not found!")
+            raise
+
+    def _setup_headers(self, sheet, headers):
+        """Write styled header row if missing"""
+        first_row = self.api.call('read', sheet.row_values, 1)
+        if not first_row or first_row[0] != headers[0]:
+            self.api.call('write', sheet.insert_row, headers, 1)
+            self.api.call('write', sheet.format, f'A1:{chr(ord("A") + len(headers) - 1)}1', {
+                'backgroundColor': {'red': 0.27, 'green': 0.45, 'blue': 0.77},
+                'textFormat': {'bold': True, 'foregroundColor': {'red': 1, 'green': 1, 'blue': 1}},
+                'horizontalAlignment': 'CENTER'
+            })
+
+    def _get_shard(self, title, create=False):
+        """Get shard worksheet by title, creating it if requested"""
+        if title not in self.shards:
+            try:
+                self.shards[title] = self.api.call('read', self.spreadsheet.worksheet, title)
+            except gspread.WorksheetNotFound:
+                if not create:
+                    return None
+                sheet = self.api.call('write', self.spreadsheet.add_worksheet, title=title, rows=SHARD_ROWS, cols=len(EPISODE_HEADERS))
+                self._setup_headers(sheet, EPISODE_HEADERS)
+                self.shards[title] = sheet
+        return self.shards[title]
+
+    def _get_rows(self, sheet, stale_ok=False):
+        """Read all data rows of a worksheet. Read-only callers may pass stale_ok to get
+        the last good copy while Sheets is degraded."""
+        return self.api.call('read', sheet.get_all_values, cache_key=sheet.title, stale_ok=stale_ok)[1:]
+
+    def _get_directory(self, stale_ok=False):
+        """Read shard directory rows: [anime_id, anime_name, shard]"""
+        rows = self._get_rows(self.directory, stale_ok)
+        return [row for row in rows if len(row) >= 3 and row[0] and row[1]]
+
+    def _catalog_rows(self, stale_ok=False):
+        """Rows holding anime IDs and names: the directory when sharded, else sheet1"""
+        if self.directory:
+            return self._get_directory(stale_ok)
+        return self._get_rows(self.sheet, stale_ok)
+
+    def _sheets_for(self, anime_name=None, stale_ok=False):
+        """Worksheets that can hold rows matching anime_name (substring, as in query_anime)"""
+        if not self.directory:
+            return [self.sheet]
+
+        titles = set()
+        for _, name, shard in self._get_directory(stale_ok):
+            if not anime_name or anime_name.lower() in name.lower():
+                titles.add(shard)
+
+        sheets = [self._get_shard(title) for title in sorted(titles)]
+        return [sheet for sheet in sheets if sheet]
+
+    def get_next_anime_id(self, all_values=None):
+        """Generate next ID"""
+        if all_values is None:
+            all_values = self._catalog_rows()
+        max_id = 0
+        for row in all_values:
+            if row and row[0]:
+                match = re.search(r'AN(\d+)', row[0])
+                if match:
+                    max_id = max(max_id, int(match.group(1)))
+        return f"AN{str(max_id + 1).zfill(3)}"
+
+    def find_anime_id(self, anime_name, all_values=None):
+        """Find ID by name"""
+        row = self._find_catalog_row(anime_name, all_values)
+        return row[0] if row else None
+
+    def _find_catalog_row(self, anime_name, all_values=None):
+        """First catalog row for an anime name"""
+        if all_values is None:
+            all_values = self._catalog_rows()
+        for row in all_values:
+            if row and len(row) > 1 and row[1].lower().strip() == anime_name.lower().strip():
+                return row
+        return None
+
+    def add_episode(self, anime_name, season, episode, quality, audio, url, status="Active"):
+        """Add episode to database - allows multiple qualities for same episode"""
+        with self.write_lock:
+            return self._add_episode(anime_name, season, episode, quality, audio, url, status)
+
+    def _add_episode(self, anime_name, season, episode, quality, audio, url, status):
+        try:
+            # Read the catalog once and reuse it for the ID lookup
+            catalog = self._catalog_rows()
+            entry = self._find_catalog_row(anime_name, catalog)
+            is_new = not entry
+            anime_id = self.get_next_anime_id(catalog) if is_new else entry[0]
+
+            if self.directory:
+                # Known anime stay in the shard the directory lists for them
+                shard = shard_for(anime_name) if is_new else entry[2]
+                sheet = self._get_shard(shard, create=True)
+                rows = self._get_rows(sheet)
+            else:
+                sheet = self.sheet
+                rows = catalog
+
+            # Check for exact duplicates (same anime, season, episode, quality, and URL)
+            existing = self._match_rows(rows, anime_name=anime_name, season=season, episode=episode, quality=quality)
+            if existing:
+                # Check if URL already exists
+                for ep in existing:
+                    if ep['url'] == url:
+                        return None, "Exact duplicate"
+                # Different URL with same quality is allowed (alternative source)
+
+            date_added = datetime.now().strftime("%Y-%m-%d %H:%M")
+            new_row = [anime_id, anime_name, season, episode, quality, audio, url, date_added, status]
+            if self.directory and is_new:
+                # Register first so the episode row is never missing from the directory
+                self.api.call('write', self.directory.append_row, [anime_id, anime_name, shard])
+            self.api.call('write', sheet.append_row, new_row)
+            return anime_id, "Success"
+        except Exception as e:
+            print(f"Add error: {e}")
+            return None, f"Error: {str(e)}"
+
+    def query_anime(self, anime_name=None, season=None, episode=None, quality=None, audio=None):
+        """Query episodes, reading only the shards that can match anime_name"""
+        try:
+            all_values = []
+            for sheet in self._sheets_for(anime_name, stale_ok=True):
+                all_values.extend(self._get_rows(sheet, stale_ok=True))
+            return self._match_rows(all_values, anime_name, season, episode, quality, audio)
+        except Exception as e:
+            print(f"Query error: {e}")
+            return []
+
+    def _match_rows(self, all_values, anime_name=None, season=None, episode=None, quality=None, audio=None):
+        """Filter episode rows"""
+        results = []
+        for row in all_values:
+            if not row or not row[0]:
+                continue
+
+            match = True
+            if anime_name and anime_name.lower() not in row[1].lower():
+                match = False
+            if season and row[2].upper() != season.upper():
+                match = False
+            if episode and row[3].upper() != episode.upper():
+                match = False
+            if quality and quality.lower() not in row[4].lower():
+                match = False
+            if audio and audio.lower() not in row[5].lower():
+                match = False
+
+            if match and len(row) >= 7:
+                results.append({
+                    'anime_id': row[0],
+                    'anime_name': row[1],
+                    'season': row[2],
+                    'episode': row[3],
+                    'quality': row[4],
+                    'audio': row[5],
+                    'url': row[6],
+                    'date_added': row[7] if len(row) > 7 else 'N/A',
+                    'status': row[8] if len(row) > 8 else 'Active'
+                })
+        return results
+
+    def get_all_anime_names(self):
+        """Get all anime names"""
+        try:
+            all_values = self._catalog_rows(stale_ok=True)
+            anime_set = set()
+            for row in all_values:
+                if row and len(row) > 1 and row[1]:
+                    anime_set.add(row[1])
+            return sorted(list(anime_set))
+        except Exception as e:
+            print(f"Get names error: {e}")
+            return []
+
+    def migrate_to_shards(self, clear_source=False):
+        """Split sheet1 into shard worksheets and build the directory. sheet1 is kept as a
+        backup unless clear_source is set - it still counts towards the spreadsheet's cell limit."""
+        with self.write_lock:
+            return self._migrate_to_shards(clear_source)
+
+    def _migrate_to_shards(self, clear_source):
+        if self.directory:
+            raise ValueError("Catalog is already sharded")
+
+        rows_by_shard = defaultdict(list)
+        directory_rows = {}
+        for row in self._get_rows(self.sheet):
+            if not row or not row[0] or len(row) < 2:
+                continue
+            shard = shard_for(row[1])
+            rows_by_shard[shard].append(row)
+            key = row[1].lower().strip()
+            if key not in directory_rows:
+                directory_rows[key] = [row[0], row[1], shard]
+
+        for shard, rows in rows_by_shard.items():
+            sheet = self._get_shard(shard, create=True)
+            # Clear leftovers from an interrupted migration
+            self.api.call('write', sheet.clear)
+            self._setup_headers(sheet, EPISODE_HEADERS)
+            self.api.call('write', sheet.append_rows, rows)
+
+        # The directory is built under a temporary title and renamed last, so a failed
+        # migration leaves the bot on sheet1 and can simply be run again
+        building = f"{DIRECTORY_SHEET} (building)"
+        try:
+            directory = self.api.call('read', self.spreadsheet.worksheet, building)
+            self.api.call('write', directory.clear)
+        except gspread.WorksheetNotFound:
+            directory = self.api.call('write', self.spreadsheet.add_worksheet, title=building, rows=max(len(directory_rows) + 1, 100), cols=len(DIRECTORY_HEADERS))
+        self._setup_headers(directory, DIRECTORY_HEADERS)
+        if directory_rows:
+            self.api.call('write', directory.append_rows, list(directory_rows.values()))
+        self.api.call('write', directory.update_title, DIRECTORY_SHEET)
+        self.directory = directory
+
+        if clear_source:
+            self.clear_source_sheet()
+
+        return {shard: len(rows) for shard, rows in sorted(rows_by_shard.items())}
+
+    def clear_source_sheet(self):
+        """Shrink sheet1 to its header row after migration, freeing its cells"""
+        if not self.directory:
+            raise ValueError("Catalog is not sharded yet")
+        self.api.call('write', self.sheet.resize, rows=1)
+
+    def get_summary(self):
+        """Get database summary"""
+        return self.get_chat_context()[0]
+
+    def get_chat_context(self, query_text=None):
+        """Get database summary, which only changes with the catalog, and the titles relevant to query_text"""
+        anime_list = self.get_all_anime_names()
+        summary = f"Available anime ({len(anime_list)}): {', '.join(anime_list[:10])}"
+        relevant = match_anime_names(query_text, anime_list, limit=10) if query_text else []
+        return summary, relevant
@@ -0,0 +1,128 @@
+"""In-memory stand-ins for gspread objects, with scripted API errors"""
+import types
+import gspread
+
+
+class FakeAPIError(Exception):
+    """Stands in for gspread's APIError, which carries the HTTP response"""
+    def __init__(self, status):
+        super().__init__(f"APIError {status}")
+        self.response = types.SimpleNamespace(status_code=status)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+class FakeWorksheet:
+    """Worksheet whose next calls fail with the scripted HTTP statuses"""
+    def __init__(self, title="Sheet1", rows=None, failures=(), spreadsheet=None):
+        self.title = title
+        self.rows = [list(row) for row in rows or []]
+        self.failures = list(failures)
+        self.spreadsheet = spreadsheet
+        self.calls = 0
+
+    def _hit(self, method):
+        self.calls += 1
+        if self.spreadsheet:
+            self.spreadsheet.log.append((method, self.title))
+            status = self.spreadsheet.broken.get((self.title, method))
+            if status:
+                raise FakeAPIError(status)
+        if self.failures:
+            raise FakeAPIError(self.failures.pop(0))
+
+    def row_values(self, row):
+        self._hit('row_values')
+        return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def get_all_values(self):
+        self._hit('get_all_values')
+        return [list(row) for row in self.rows]
+
+    def insert_row(self, values, index):
+        self._hit('insert_row')
+        self.rows.insert(index - 1, list(values))
+
+    def format(self, cell_range, fmt):
+        self._hit('format')
+
+    def append_row(self, values):
+        self._hit('append_row')
+        self.rows.append(list(values))
+
+    def append_rows(self, values):
+        self._hit('append_rows')
+        self.rows.extend(list(row) for row in values)
+
+    def clear(self):
+        self._hit('clear')
+        self.rows = []
+
+    def resize(self, rows=None, cols=None):
+        self._hit('resize')
+        if rows is not None:
+            self.rows = self.rows[:rows]
+
+    def update_title(self, title):
+        self._hit('update_title')
+        self.title = title
+
+
+class FakeSpreadsheet:
+    """Spreadsheet of FakeWorksheets; broken maps (title, method) to a status that method always fails with"""
+    def __init__(self, rows=None):
+        self.log = []
+        self.broken = {}
+        # Statuses the next metadata requests (worksheet lookups) fail with
+        self.failures = []
+        self.worksheets = [FakeWorksheet("Sheet1", rows, spreadsheet=self)]
+
+    @property
+    def sheet1(self):
+        return self.get_worksheet(0)
+
+    def _metadata(self, method, arg):
+        self.log.append((method, arg))
+        if self.failures:
+            raise FakeAPIError(self.failures.pop(0))
+
+    def get_worksheet(self, index):
+        self._metadata('get_worksheet', index)
+        return self.worksheets[index]
+
+    def worksheet(self, title):
+        self._metadata('worksheet', title)
+        for sheet in self.worksheets:
+            if sheet.title == title:
+                return sheet
+        raise gspread.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols):
+        self.log.append(('add_worksheet', title))
+        if any(sheet.title == title for sheet in self.worksheets):
+            raise FakeAPIError(400)
+        sheet = FakeWorksheet(title, spreadsheet=self)
+        self.worksheets.append(sheet)
+        return sheet
+
+    def titles(self):
+        return [sheet.title for sheet in self.worksheets]
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open(self, name):
+        return self.spreadsheet
@@ -0,0 +1,115 @@
+import random
+import string
+import json
+from gemini_utils import JSONArrayStream, episode_key, extract_json_object, match_anime_names, normalize_url, validate_episode
+
+
+NAMES = ["Air", "Tail", "Fairy Tail", "Naruto", "Naruto Shippuden", "One Piece",
+         "Attack on Titan", "365 Days to the Wedding", "Caw Ame"]
+
+
+def test_whole_title_matches_on_word_boundaries():
+    # "Air" is inside "fairy" and "Tail" inside "Fairy Tail"; neither was asked for
+    assert match_anime_names("fairy tail s2 1080p", NAMES) == ["Fairy Tail"]
+    assert match_anime_names("tail", NAMES) == ["Tail", "Fairy Tail"]
+
+
+def test_longer_title_in_query_ranks_first():
+    assert match_anime_names("naruto shippuden e5", NAMES) == ["Naruto Shippuden"]
+    assert match_anime_names("naruto", NAMES) == ["Naruto", "Naruto Shippuden"]
+
+
+def test_fuzzy_and_partial_matches():
+    assert match_anime_names("one pice", NAMES) == ["One Piece"]
+    assert match_anime_names("wedding", NAMES) == ["365 Days to the Wedding"]
+
+
+def test_short_and_common_query_words_do_not_match():
+    query = "can you find me the second season of attack on titan in 1080p dual audio"
+    assert match_anime_names(query, NAMES) == ["Attack on Titan"]
+    assert match_anime_names("show me the latest", NAMES) == []
+
+
+def test_large_catalog_has_no_junk_candidates():
+    rng = random.Random(1)
+    def word():
+        return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 8))).capitalize()
+    names = [' '.join(word() for _ in range(rng.randint(1, 4))) for _ in range(2000)] + NAMES
+    query = "can you find me the second season of attack on titan in 1080p dual audio"
+    assert match_anime_names(query, names) == ["Attack on Titan"]
+
+
+def feed_in_chunks(text, size):
+    stream = JSONArrayStream()
+    items = []
+    for i in range(0, len(text), size):
+        items += stream.feed(text[i:i + size])
+    return stream, items
+
+
+ITEMS = [
+    {"anime_name": 'Say "Hi" \\ bye', "url": "https://x/1"},
+    {"anime_name": "Braces } ] { [ inside", "url": "https://x/2"},
+    {"anime_name": "Plain", "url": "https://x/3"},
+]
+
+
+def test_stream_handles_every_chunk_boundary():
+    text = "```json\n" + json.dumps(ITEMS) + "\n```"
+    # Size 1 splits inside every string, escape sequence and brace
+    for size in range(1, len(text) + 1):
+        stream, items = feed_in_chunks(text, size)
+        assert items == ITEMS
+        assert stream.complete and stream.rejected == 0
+
+
+def test_stream_skips_bracketed_prose_before_array():
+    text = "Parsed [S01-E01] and [480p] entries: [ {\"a\": 1}, {\"a\": 2} ]"
+    for size in (1, 7, len(text)):
+        stream, items = feed_in_chunks(text, size)
+        assert items == [{"a": 1}, {"a": 2}]
+
+
+def test_stream_waits_when_chunk_ends_at_bracket():
+    stream = JSONArrayStream()
+    assert stream.feed("Result: [") == []
+    assert stream.feed("  ") == []
+    assert not stream.complete
+    assert stream.feed('{"a": 1}]') == [{"a": 1}]
+    assert stream.complete
+
+
+def test_stream_salvages_truncated_output():
+    stream, items = feed_in_chunks('[{"a": 1}, {"a": 2}, {"a": 3, "b": "cut of', 5)
+    assert items == [{"a": 1}, {"a": 2}]
+    assert not stream.complete
+
+
+def test_stream_skips_malformed_middle_item():
+    stream, items = feed_in_chunks('[{"a": 1}, {"a": }, {"a": 3}]', 4)
+    assert items == [{"a": 1}, {"a": 3}]
+    assert stream.complete and stream.rejected == 1
+
+
+def test_extract_json_object_ignores_fences():
+    assert extract_json_object('```json\n{"intent": "search", "season": null}\n```') == {"intent": "search", "season": None}
+
+
+def test_validate_episode_normalizes_fields():
+    ep = validate_episode({"anime_name": " Naruto ", "season": "1", "episode": "Episode 5",
+                           "url": "`https://x/ep5].`"})
+    assert ep == {"anime_name": "Naruto", "season": "S01", "episode": "E05", "quality": "720p",
+                  "audio": "Single", "url": "https://x/ep5"}
+
+
+def test_validate_episode_rejects_unusable_items():
+    assert validate_episode(["not", "a", "dict"]) is None
+    assert validate_episode({"anime_name": "Naruto", "episode": "E01", "url": "not a url"}) is None
+    assert validate_episode({"anime_name": "N", "episode": "E01", "url": "https://x"}) is None
+    assert validate_episode({"anime_name": "Naruto", "url": "https://x"}) is None
+
+
+def test_url_and_episode_keys_ignore_formatting():
+    assert normalize_url("https://x/1],") == normalize_url("https://x/1.") == "https://x/1"
+    assert episode_key({"anime_name": "Naruto ", "season": "s01", "episode": "e01", "quality": "480P"}) == \
+        episode_key({"anime_name": "naruto", "season": "S01", "episode": "E01", "quality": "480p"})
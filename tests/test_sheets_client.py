@@ -0,0 +1,104 @@
+import pytest
+from sheets_client import SheetsClient, SheetsUnavailable
+from tests.fakes import FakeAPIError, FakeClock, FakeWorksheet
+
+
+ROWS = [["Anime ID", "Anime Name"], ["AN001", "Naruto"]]
+
+
+def make_sheet(failures=()):
+    return FakeWorksheet(rows=ROWS, failures=failures)
+
+
+def make_client(clock, **kwargs):
+    kwargs.setdefault('max_retries', 3)
+    return SheetsClient(sleep=clock.sleep, clock=clock.monotonic, **kwargs)
+
+
+def test_read_retries_quota_and_server_errors_with_backoff():
+    clock = FakeClock()
+    client = make_client(clock)
+    sheet = make_sheet(failures=[429, 503])
+
+    assert client.call('read', sheet.get_all_values)[1] == ["AN001", "Naruto"]
+    assert sheet.calls == 3
+    assert len(clock.sleeps) == 2
+    assert 0 <= clock.sleeps[0] <= 1.0 and 0 <= clock.sleeps[1] <= 2.0
+
+
+def test_write_retried_only_on_quota_error():
+    clock = FakeClock()
+    client = make_client(clock)
+
+    sheet = make_sheet(failures=[429])
+    client.call('write', sheet.append_row, ["AN002", "Bleach"])
+    assert sheet.rows[-1] == ["AN002", "Bleach"]
+    assert sheet.calls == 2
+
+    # A 5xx write may already have been applied, so it must not be repeated
+    sheet = make_sheet(failures=[503])
+    with pytest.raises(SheetsUnavailable):
+        client.call('write', sheet.append_row, ["AN002", "Bleach"])
+    assert sheet.calls == 1
+
+
+def test_non_retryable_error_propagates():
+    clock = FakeClock()
+    client = make_client(clock)
+    sheet = make_sheet(failures=[404])
+
+    with pytest.raises(FakeAPIError):
+        client.call('read', sheet.get_all_values)
+    assert sheet.calls == 1
+    assert clock.sleeps == []
+
+
+def test_budget_delays_requests_before_quota_is_exhausted():
+    clock = FakeClock()
+    client = make_client(clock, reads_per_min=2)
+    sheet = make_sheet()
+
+    client.call('read', sheet.get_all_values)
+    clock.now += 10
+    client.call('read', sheet.get_all_values)
+    assert clock.sleeps == []
+
+    client.call('read', sheet.get_all_values)
+    assert clock.sleeps == [pytest.approx(50.0)]
+    assert sheet.calls == 3
+
+
+def test_stale_reads_only_for_read_only_callers():
+    clock = FakeClock()
+    client = make_client(clock, max_retries=1, breaker_threshold=10)
+    sheet = make_sheet()
+    client.call('read', sheet.get_all_values, cache_key="Sheet1")
+
+    sheet.failures = [503] * 4
+    assert client.call('read', sheet.get_all_values, cache_key="Sheet1", stale_ok=True)[1] == ["AN001", "Naruto"]
+    with pytest.raises(SheetsUnavailable):
+        client.call('read', sheet.get_all_values, cache_key="Sheet1")
+
+
+def test_circuit_opens_serves_cache_and_recovers():
+    clock = FakeClock()
+    client = make_client(clock, max_retries=1, breaker_threshold=2, breaker_cooldown=60)
+    sheet = make_sheet()
+    client.call('read', sheet.get_all_values, cache_key="Sheet1")
+
+    sheet.failures = [429] * 4
+    for _ in range(2):
+        client.call('read', sheet.get_all_values, cache_key="Sheet1", stale_ok=True)
+    assert client.open_until > clock.now
+
+    # While open, Sheets is not called at all
+    calls = sheet.calls
+    assert client.call('read', sheet.get_all_values, cache_key="Sheet1", stale_ok=True)[1] == ["AN001", "Naruto"]
+    with pytest.raises(SheetsUnavailable):
+        client.call('write', sheet.append_row, ["AN002", "Bleach"])
+    assert sheet.calls == calls
+
+    clock.now = client.open_until
+    client.call('write', sheet.append_row, ["AN002", "Bleach"])
+    assert sheet.rows[-1] == ["AN002", "Bleach"]
+    assert client.failures == 0
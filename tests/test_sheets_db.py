@@ -0,0 +1,145 @@
+import pytest
+from sheets_client import SheetsClient
+from sheets_db import EPISODE_HEADERS, GoogleSheetsDB, shard_for
+from tests.fakes import FakeAPIError, FakeClient, FakeClock, FakeSpreadsheet
+
+
+def make_db(rows=None, failures=()):
+    spreadsheet = FakeSpreadsheet(rows)
+    spreadsheet.failures = list(failures)
+    clock = FakeClock()
+    api = SheetsClient(max_retries=1, sleep=clock.sleep, clock=clock.monotonic)
+    return GoogleSheetsDB(None, "Anime Database", client=FakeClient(spreadsheet), api=api), spreadsheet
+
+
+def make_sharded_db(rows=None):
+    db, spreadsheet = make_db(rows)
+    db.migrate_to_shards()
+    spreadsheet.log.clear()
+    return db, spreadsheet
+
+
+def episode_row(anime_id, name, episode, url):
+    return [anime_id, name, "S01", episode, "720p", "Single", url, "2025-01-01 00:00", "Active"]
+
+
+@pytest.mark.parametrize("name, shard", [
+    ("Attack on Titan", "Episodes A-E"),
+    ("eden", "Episodes A-E"),
+    ("Fate", "Episodes F-J"),
+    ("Jujutsu Kaisen", "Episodes F-J"),
+    ("Kaiju", "Episodes K-O"),
+    ("  Overlord", "Episodes K-O"),
+    ("Pokemon", "Episodes P-T"),
+    ("Tokyo Ghoul", "Episodes P-T"),
+    ("Uzumaki", "Episodes U-Z"),
+    ("zetman", "Episodes U-Z"),
+    ("86", "Episodes #"),
+    ("[Oshi no Ko]", "Episodes #"),
+    ("Élan", "Episodes A-E"),
+    ("Ōkami", "Episodes K-O"),
+    ("進撃の巨人", "Episodes #"),
+    ("", "Episodes #"),
+])
+def test_shard_for_boundaries(name, shard):
+    assert shard_for(name) == shard
+
+
+def test_unsharded_until_migrated():
+    db, spreadsheet = make_db()
+    assert db.directory is None
+    assert spreadsheet.worksheets[0].rows == [EPISODE_HEADERS]
+    assert db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/1") == ("AN001", "Success")
+    assert spreadsheet.titles() == ["Sheet1"]
+
+
+def test_new_anime_registered_in_directory_before_episode_row():
+    db, spreadsheet = make_sharded_db()
+    assert db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/1") == ("AN001", "Success")
+
+    writes = [entry for entry in spreadsheet.log if entry[0] == 'append_row']
+    assert writes == [('append_row', 'Directory'), ('append_row', 'Episodes K-O')]
+    assert db.query_anime(anime_name="naruto")[0]['url'] == "https://x/1"
+
+
+def test_failed_directory_write_leaves_no_orphan_episode():
+    db, spreadsheet = make_sharded_db()
+    spreadsheet.broken[("Directory", "append_row")] = 400
+
+    anime_id, status = db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/1")
+    assert anime_id is None and status.startswith("Error")
+    assert db._get_shard("Episodes K-O").rows == [EPISODE_HEADERS]
+
+    del spreadsheet.broken[("Directory", "append_row")]
+    assert db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/1") == ("AN001", "Success")
+    assert db.add_episode("Bleach", "S01", "E01", "720p", "Single", "https://x/2") == ("AN002", "Success")
+
+
+def test_duplicate_check_reads_only_the_anime_shard():
+    db, spreadsheet = make_sharded_db()
+    db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/1")
+    db.add_episode("Bleach", "S01", "E01", "720p", "Single", "https://x/2")
+    spreadsheet.log.clear()
+
+    assert db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/1") == (None, "Exact duplicate")
+    reads = [entry for entry in spreadsheet.log if entry[0] == 'get_all_values']
+    assert reads == [('get_all_values', 'Directory'), ('get_all_values', 'Episodes K-O')]
+
+    # Alternative source for the same episode is allowed
+    assert db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/3") == ("AN001", "Success")
+
+
+def test_known_anime_stays_in_directory_shard():
+    db, spreadsheet = make_sharded_db()
+    db.directory.rows.append(["AN007", "Naruto", "Episodes A-E"])
+    shard = db._get_shard("Episodes A-E", create=True)
+    shard.rows.append(episode_row("AN007", "Naruto", "E01", "https://x/1"))
+
+    assert db.add_episode("Naruto", "S01", "E01", "720p", "Single", "https://x/1") == (None, "Exact duplicate")
+    assert db.add_episode("Naruto", "S01", "E02", "720p", "Single", "https://x/2") == ("AN007", "Success")
+    assert len(shard.rows) == 3
+    assert "Episodes K-O" not in spreadsheet.titles()
+
+
+def test_migration_rerun_after_partial_failure():
+    rows = [EPISODE_HEADERS,
+            episode_row("AN001", "Naruto", "E01", "https://x/1"),
+            episode_row("AN001", "Naruto", "E02", "https://x/2"),
+            episode_row("AN002", "Bleach", "E01", "https://x/3")]
+    db, spreadsheet = make_db(rows)
+    spreadsheet.broken[("Directory (building)", "append_rows")] = 400
+
+    with pytest.raises(FakeAPIError):
+        db.migrate_to_shards()
+    # Still on sheet1: no Directory, nothing lost
+    assert db.directory is None
+    assert "Directory" not in spreadsheet.titles()
+    assert len(db.query_anime(anime_name="naruto")) == 2
+
+    del spreadsheet.broken[("Directory (building)", "append_rows")]
+    assert db.migrate_to_shards() == {"Episodes A-E": 1, "Episodes K-O": 2}
+    assert "Directory (building)" not in spreadsheet.titles()
+    assert db.directory.rows[1:] == [["AN001", "Naruto", "Episodes K-O"], ["AN002", "Bleach", "Episodes A-E"]]
+    # Shards written by the failed attempt are not duplicated
+    assert len(db._get_shard("Episodes K-O").rows) == 3
+    assert len(db.query_anime(anime_name="naruto")) == 2
+    assert db.get_next_anime_id() == "AN003"
+
+    with pytest.raises(ValueError):
+        db.migrate_to_shards()
+
+
+def test_clear_source_after_migration():
+    rows = [EPISODE_HEADERS, episode_row("AN001", "Naruto", "E01", "https://x/1")]
+    db, spreadsheet = make_db(rows)
+    db.migrate_to_shards(clear_source=True)
+    assert spreadsheet.worksheets[0].rows == [EPISODE_HEADERS]
+    assert db.get_all_anime_names() == ["Naruto"]
+
+
+def test_startup_survives_quota_errors():
+    # The sheet1 lookup hits a 429 before succeeding
+    db, spreadsheet = make_db(failures=[429])
+    assert db.sheet is spreadsheet.worksheets[0]
+    assert db.directory is None
+    assert spreadsheet.log[:2] == [('get_worksheet', 0), ('get_worksheet', 0)]